@@ -1,3 +1,142 @@
-from django.test import TestCase
+from datetime import datetime, timezone
+from urllib.parse import quote
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from blog import views
+from djangofirebase.write_behind import DELETE, SET, UPDATE
+
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class CursorTests(SimpleTestCase):
+    def test_cursor_round_trips(self):
+        created_at = datetime(2026, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc)
+        cursor = views._encode_cursor(created_at, 'post|with|bars')
+        self.assertEqual(views._decode_cursor(cursor), (created_at, 'post|with|bars'))
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('garbage', 'not-a-date|p1', '2026-01-01T00:00:00+00:00|'):
+            with self.assertRaises(ValueError):
+                views._decode_cursor(cursor)
+
+
+class PageSizeTests(SimpleTestCase):
+    def page_size(self, query):
+        return views._page_size(RequestFactory().get('/' + query))
+
+    def test_default_and_clamping(self):
+        self.assertEqual(self.page_size(''), views.POSTS_PER_PAGE)
+        self.assertEqual(self.page_size('?limit=abc'), views.POSTS_PER_PAGE)
+        self.assertEqual(self.page_size('?limit=0'), 1)
+        self.assertEqual(self.page_size('?limit=5'), 5)
+        self.assertEqual(self.page_size('?limit=1000'), views.MAX_POSTS_PER_PAGE)
+
+
+@override_settings(ROOT_URLCONF='blog.urls')
+class PostListTests(SimpleTestCase):
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.query = self.db.collection.return_value.order_by.return_value.order_by.return_value
+        self.docs = [
+            FakeDoc(post_id, {'title': f"title {post_id}", 'author': 'a', 'created_at': self.created_at})
+            for post_id in ('p1', 'p2', 'p3')
+        ]
+
+    def test_malformed_cursor_returns_400(self):
+        response = views.post_list(RequestFactory().get('/?after=garbage'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_continues_after_last_post(self):
+        self.query.start_after.return_value.limit.return_value.stream.return_value = iter(self.docs[2:])
+        cursor = views._encode_cursor(self.created_at, 'p2')
+
+        response = views.post_list(RequestFactory().get('/', {'after': cursor, 'limit': 2}))
+
+        self.query.start_after.assert_called_once_with({'created_at': self.created_at, '__name__': 'p2'})
+        self.query.start_after.return_value.limit.assert_called_once_with(3)
+        self.assertContains(response, 'title p3')
+        self.assertNotContains(response, 'Older posts')
+
+    def test_next_cursor_links_to_older_posts(self):
+        self.query.limit.return_value.stream.return_value = iter(self.docs)
+
+        response = views.post_list(RequestFactory().get('/?limit=2'))
+
+        self.assertContains(response, 'title p2')
+        self.assertNotContains(response, 'title p3')
+        next_cursor = views._encode_cursor(self.created_at, 'p2')
+        self.assertIn(f"after={quote(next_cursor, safe='')}", response.content.decode())
+
+    def test_stream_yields_head_posts_then_tail(self):
+        self.query.limit.return_value.stream.return_value = iter(self.docs)
+
+        response = views.post_list(RequestFactory().get('/?limit=2&stream=1'))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 4)
+        self.assertIn('<title>All Posts</title>', chunks[0])
+        self.assertIn('title p1', chunks[1])
+        self.assertIn('title p2', chunks[2])
+        self.assertIn('Older posts', chunks[3])
+        self.assertIn('&stream=1', chunks[3])
+        self.assertTrue(chunks[3].rstrip().endswith('</html>'))
+
+    def test_stream_and_page_render_the_same_markup(self):
+        self.query.limit.return_value.stream.return_value = iter(self.docs)
+        page = views.post_list(RequestFactory().get('/?limit=2')).content.decode()
+
+        self.query.limit.return_value.stream.return_value = iter(self.docs)
+        response = views.post_list(RequestFactory().get('/?limit=2&stream=1'))
+        streamed = b''.join(response.streaming_content).decode()
+
+        normalise = lambda html: ' '.join(html.replace('&stream=1', '').split())
+        self.assertEqual(normalise(streamed), normalise(page))
+
+
+class IterPageOverlayTests(SimpleTestCase):
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.docs = [
+            FakeDoc(post_id, {'title': post_id, 'created_at': self.created_at})
+            for post_id in ('p1', 'p2', 'p3', 'p4')
+        ]
+        self.pending = {
+            'new': [(SET, {'title': 'new', 'created_at': self.created_at}, self.created_at)],
+            'p1': [(UPDATE, {'title': 'edited'}, self.created_at)],
+            'p2': [(DELETE, {}, self.created_at)],
+        }
+        patcher = mock.patch.object(views.write_behind, 'pending_for', return_value=self.pending)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def iter_page(self, url, limit=3):
+        page = {'next_cursor': None}
+        posts = list(views._iter_page(RequestFactory().get(url), iter(self.docs), limit, page))
+        return posts, page
+
+    def test_first_page_shows_pending_writes(self):
+        posts, page = self.iter_page('/')
+
+        self.assertEqual([post['id'] for post in posts], ['new', 'p1', 'p3'])
+        self.assertEqual(posts[1]['title'], 'edited')
+        # The cursor follows the Firestore documents, not the overlay
+        self.assertEqual(page['next_cursor'], views._encode_cursor(self.created_at, 'p3'))
+
+    def test_later_pages_do_not_repeat_pending_posts(self):
+        posts, _ = self.iter_page('/?after=' + views._encode_cursor(self.created_at, 'p0'))
+
+        self.assertEqual([post['id'] for post in posts], ['p1', 'p3'])
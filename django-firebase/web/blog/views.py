@@ -1,39 +1,169 @@
+from datetime import datetime
+
 from django.shortcuts import render, redirect
-from django.http import HttpResponseNotFound
+from django.http import HttpResponseBadRequest, HttpResponseNotFound, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
 # This line correctly imports the 'db' object using the absolute path from the project root.
 from djangofirebase.settings import db
+from djangofirebase import write_behind
 from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
 
-def post_list(request):
+POSTS_PER_PAGE = 10
+MAX_POSTS_PER_PAGE = 100
+
+
+def _page_size(request):
     """
-    Retrieves and displays a list of all blog posts from Firestore.
+    Reads the requested page size from the query string, clamped to a sane range.
     """
-    posts_ref = db.collection('posts').order_by('created_at', direction=firestore.Query.DESCENDING)
-    docs = posts_ref.stream()
-    posts = []
-    for doc in docs:
+    try:
+        limit = int(request.GET.get('limit', POSTS_PER_PAGE))
+    except (TypeError, ValueError):
+        return POSTS_PER_PAGE
+    return max(1, min(limit, MAX_POSTS_PER_PAGE))
+
+
+def _encode_cursor(created_at, post_id):
+    return f"{created_at.isoformat()}|{post_id}"
+
+
+def _decode_cursor(cursor):
+    """
+    Splits a page cursor into its created_at and post ID parts.
+    Raises ValueError if the cursor is malformed.
+    """
+    created_at, separator, post_id = cursor.partition('|')
+    if not separator or not post_id:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return datetime.fromisoformat(created_at), post_id
+
+
+def _posts_page_query(request, limit):
+    """
+    Builds the Firestore query for one page of posts, newest first.
+    The 'after' cursor holds the created_at and ID of the last post on the
+    previous page, the ID breaking ties between posts created at the same time.
+    Paging needs no extra read and keeps working if that post is deleted.
+    One extra document is requested so we know whether another page exists.
+    Raises ValueError if the cursor is malformed.
+    """
+    query = (
+        db.collection('posts')
+        .order_by('created_at', direction=firestore.Query.DESCENDING)
+        .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    )
+    after = request.GET.get('after', '').strip()
+    if after:
+        created_at, post_id = _decode_cursor(after)
+        query = query.start_after({'created_at': created_at, FieldPath.document_id(): post_id})
+    return query.limit(limit + 1)
+
+
+def _iter_page(request, docs, limit, page):
+    """
+    Yields up to `limit` post dicts from the Firestore iterator and records
+    the cursor for the next page in `page['next_cursor']`.
+    The requesting user's pending writes are laid over the posts; posts they
+    created that are still queued lead the first page.
+    """
+    pending = write_behind.pending_for(request, 'posts')
+    if not request.GET.get('after'):
+        for post_id, pending_writes in pending.items():
+            if write_behind.creates_document(pending_writes):
+                post_data = write_behind.apply_pending(None, pending_writes)
+                if post_data is not None:
+                    post_data['id'] = post_id
+                    yield post_data
+
+    last_cursor = None
+    for count, doc in enumerate(docs):
+        if count == limit:
+            page['next_cursor'] = last_cursor
+            break
         post_data = doc.to_dict()
+        last_cursor = _encode_cursor(post_data['created_at'], doc.id)
+        if doc.id in pending:
+            if write_behind.creates_document(pending[doc.id]):
+                # Already shown at the top of the first page
+                continue
+            post_data = write_behind.apply_pending(post_data, pending[doc.id])
+            if post_data is None:
+                continue
         post_data['id'] = doc.id
-        # Format the timestamp here in the view
-        if post_data.get('created_at'):
-            post_data['created_at_formatted'] = post_data['created_at'].strftime("%Y-%m-%d %H:%M")
-        else:
-            post_data['created_at_formatted'] = 'N/A'
-        posts.append(post_data)
-    return render(request, 'blog/post_list.html', {'posts': posts})
+        yield post_data
+
+
+def _get_post(request, post_ref):
+    """
+    Reads a post, including the requesting user's pending writes to it.
+    Returns None if the post does not exist.
+    """
+    post_doc = post_ref.get()
+    post = post_doc.to_dict() if post_doc.exists else None
+    pending_writes = write_behind.pending_for(request, 'posts').get(post_ref.id)
+    if pending_writes:
+        post = write_behind.apply_pending(post, pending_writes)
+    if post is not None:
+        post['id'] = post_ref.id
+    return post
+
+
+def post_list(request):
+    """
+    Displays one page of blog posts from Firestore, using the created_at and ID
+    of the last post shown as the cursor for the next page.
+    Pass ?stream=1 to render the posts incrementally as they arrive from Firestore.
+    """
+    limit = _page_size(request)
+    try:
+        docs = _posts_page_query(request, limit).stream()
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page cursor.")
+    page = {'next_cursor': None}
+
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(_stream_post_list(request, docs, limit, page))
+
+    posts = list(_iter_page(request, docs, limit, page))
+    return render(request, 'blog/post_list.html', {
+        'posts': posts,
+        'next_cursor': page['next_cursor'],
+        'limit': limit,
+    })
+
+
+def _stream_post_list(request, docs, limit, page):
+    """
+    Yields the post list page in chunks: everything before the posts, one
+    chunk per post, then the rest of the page once the next cursor is known.
+    """
+    yield render_to_string('blog/post_list_head.html', request=request)
+
+    item_template = get_template('blog/post_list_item.html')
+    empty = True
+    for post in _iter_page(request, docs, limit, page):
+        empty = False
+        yield item_template.render({'post': post})
+    if empty:
+        yield render_to_string('blog/post_list_empty.html')
+
+    yield render_to_string('blog/post_list_tail.html', {
+        'stream': True,
+        'next_cursor': page['next_cursor'],
+        'limit': limit,
+    }, request=request)
+
 
 def post_detail(request, post_id):
     """
     Retrieves and displays a single blog post.
     """
-    post_ref = db.collection('posts').document(post_id)
-    post_doc = post_ref.get()
+    post = _get_post(request, db.collection('posts').document(post_id))
 
-    if not post_doc.exists:
+    if post is None:
         return HttpResponseNotFound("Post not found.")
 
-    post = post_doc.to_dict()
-    post['id'] = post_doc.id
     if post.get('created_at'):
         post['created_at_formatted'] = post['created_at'].strftime("%Y-%m-%d %H:%M")
     else:
@@ -51,13 +181,14 @@ def post_create(request):
         author = request.POST.get('author')
 
         # Add a new document with an auto-generated ID
-        db.collection('posts').add({
+        writer = write_behind.writer_id(request)
+        write_behind.queue_set(db.collection('posts').document(), {
             'title': title,
             'content': content,
             'author': author,
             'created_at': firestore.SERVER_TIMESTAMP
-        })
-        return redirect('post_list')
+        }, writer)
+        return write_behind.remember_writer(redirect('post_list'), writer)
 
     return render(request, 'blog/post_form.html', {'form_title': 'Create New Post'})
 
@@ -73,24 +204,24 @@ def post_update(request, post_id):
         author = request.POST.get('author')
 
         # Update the document
-        post_ref.update({
+        writer = write_behind.writer_id(request)
+        write_behind.queue_update(post_ref, {
             'title': title,
             'content': content,
             'author': author
-        })
-        return redirect('post_list')
+        }, writer)
+        return write_behind.remember_writer(redirect('post_list'), writer)
 
-    post_doc = post_ref.get()
-    if not post_doc.exists:
+    post = _get_post(request, post_ref)
+    if post is None:
         return HttpResponseNotFound("Post not found.")
 
-    post = post_doc.to_dict()
-    post['id'] = post_doc.id
     return render(request, 'blog/post_form.html', {'form_title': 'Update Post', 'post': post})
 
 def post_delete(request, post_id):
     """
     Deletes a specific blog post.
     """
-    db.collection('posts').document(post_id).delete()
-    return redirect('post_list')
+    writer = write_behind.writer_id(request)
+    write_behind.queue_delete(db.collection('posts').document(post_id), writer)
+    return write_behind.remember_writer(redirect('post_list'), writer)
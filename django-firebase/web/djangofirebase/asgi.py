@@ -8,11 +8,11 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
+from flashtech.middleware import ScreenTokenAuthMiddleware
 from flashtech.routing import websocket_urlpatterns  # Import your new routing file
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangofirebase.settings')
@@ -20,8 +20,12 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangofirebase.settings')
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        ScreenTokenAuthMiddleware(
             URLRouter(websocket_urlpatterns)
         )
     ),
 })
+
+from djangofirebase import write_behind  # noqa: E402  (needs the app registry loaded above)
+
+write_behind.start()
@@ -186,6 +186,16 @@ firebase_admin.initialize_app(FIREBASE_CRED)
 # This allows you to import `db` from settings in any part of your app.
 db = firestore.client()
 
+# Write-behind queue for Firestore mutations (see djangofirebase/write_behind.py).
+# Off by default: views then write to Firestore synchronously.
+FIRESTORE_WRITE_BEHIND = os.environ.get('FIRESTORE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+# Local journal holding writes that have not been flushed yet
+FIRESTORE_WRITE_BEHIND_JOURNAL = os.environ.get('FIRESTORE_WRITE_BEHIND_JOURNAL', BASE_DIR / 'write_behind.sqlite3')
+# Flush when this many writes are pending (Firestore allows at most 500 per batch)...
+FIRESTORE_WRITE_BEHIND_BATCH_SIZE = 500
+# ...or after this many seconds, whichever comes first
+FIRESTORE_WRITE_BEHIND_INTERVAL = 2.0
+
 
 #link for enabling Cloud Firestore API  --> https://console.developers.google.com/apis/api/firestore.googleapis.com/overview?project=django-fw
 #link for creating firebase datastore(database) --> https://console.cloud.google.com/datastore/setup?project=django-fw
@@ -0,0 +1,227 @@
+import os
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+
+from djangofirebase import write_behind
+from djangofirebase.write_behind import DELETE, SET, UPDATE, WriteBehindQueue
+
+
+class FakeBatch:
+    """
+    Records the operations of a WriteBatch; `on_commit` runs before they are applied.
+    """
+
+    def __init__(self, committed, on_commit=None):
+        self.ops = []
+        self.committed = committed
+        self.on_commit = on_commit
+
+    def set(self, path, data):
+        self.ops.append((SET, path, data))
+
+    def update(self, path, data):
+        self.ops.append((UPDATE, path, data))
+
+    def delete(self, path):
+        self.ops.append((DELETE, path, None))
+
+    def commit(self):
+        if self.on_commit is not None:
+            self.on_commit(self)
+        self.committed.extend(self.ops)
+
+
+class CoalesceTests(SimpleTestCase):
+    def test_update_after_update_merges_fields(self):
+        op, data = write_behind._coalesce(UPDATE, {'title': 'a', 'author': 'x'}, UPDATE, {'title': 'b'})
+        self.assertEqual(op, UPDATE)
+        self.assertEqual(data, {'title': 'b', 'author': 'x'})
+
+    def test_update_after_set_stays_a_set_without_deleted_fields(self):
+        op, data = write_behind._coalesce(
+            SET, {'title': 'a', 'author': 'x'}, UPDATE, {'title': 'b', 'author': firestore.DELETE_FIELD}
+        )
+        self.assertEqual(op, SET)
+        self.assertEqual(data, {'title': 'b'})
+
+    def test_set_after_delete_replaces_it(self):
+        op, data = write_behind._coalesce(DELETE, {}, SET, {'title': 'a'})
+        self.assertEqual(op, SET)
+        self.assertEqual(data, {'title': 'a'})
+
+    def test_update_after_delete_keeps_the_delete(self):
+        op, data = write_behind._coalesce(DELETE, {}, UPDATE, {'title': 'b'})
+        self.assertEqual(op, DELETE)
+        self.assertEqual(data, {})
+
+    def test_delete_after_set_replaces_it(self):
+        op, data = write_behind._coalesce(SET, {'title': 'a'}, DELETE, {})
+        self.assertEqual(op, DELETE)
+        self.assertEqual(data, {})
+
+
+class SerializationTests(SimpleTestCase):
+    def test_sentinels_and_datetimes_round_trip(self):
+        when = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        data = {
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'old_field': firestore.DELETE_FIELD,
+            'edited_at': when,
+            'title': 'a',
+        }
+        loaded = write_behind._loads(write_behind._dumps(data))
+        self.assertIs(loaded['created_at'], firestore.SERVER_TIMESTAMP)
+        self.assertIs(loaded['old_field'], firestore.DELETE_FIELD)
+        self.assertEqual(loaded['edited_at'], when)
+        self.assertEqual(loaded['title'], 'a')
+
+
+class ApplyPendingTests(SimpleTestCase):
+    queued_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def test_update_is_laid_over_firestore_data(self):
+        data = write_behind.apply_pending(
+            {'title': 'a', 'author': 'x', 'old': 1},
+            [(UPDATE, {'title': 'b', 'old': firestore.DELETE_FIELD}, self.queued_at)],
+        )
+        self.assertEqual(data, {'title': 'b', 'author': 'x'})
+
+    def test_set_shows_server_timestamp_as_queue_time(self):
+        data = write_behind.apply_pending(
+            None, [(SET, {'title': 'a', 'created_at': firestore.SERVER_TIMESTAMP}, self.queued_at)]
+        )
+        self.assertEqual(data, {'title': 'a', 'created_at': self.queued_at})
+
+    def test_writes_apply_in_order(self):
+        pending = [
+            (SET, {'title': 'a', 'author': 'x'}, self.queued_at),
+            (UPDATE, {'title': 'b'}, self.queued_at),
+        ]
+        self.assertEqual(write_behind.apply_pending(None, pending), {'title': 'b', 'author': 'x'})
+
+    def test_delete_hides_the_document(self):
+        self.assertIsNone(write_behind.apply_pending({'title': 'a'}, [(DELETE, {}, self.queued_at)]))
+
+    def test_update_of_missing_document_is_ignored(self):
+        self.assertIsNone(write_behind.apply_pending(None, [(UPDATE, {'title': 'b'}, self.queued_at)]))
+
+
+class WriteBehindQueueTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = os.path.join(tmp.name, 'journal.sqlite3')
+        self.queue = WriteBehindQueue(self.journal)
+
+        self.committed = []
+        self.on_commit = None
+        db_patcher = mock.patch.object(write_behind, 'db')
+        db = db_patcher.start()
+        self.addCleanup(db_patcher.stop)
+        db.batch.side_effect = lambda: FakeBatch(self.committed, self.on_commit)
+        # Document references are represented by their paths
+        db.document.side_effect = lambda path: path
+
+    def test_rapid_updates_flush_as_one_write(self):
+        self.queue.enqueue('posts/p1', UPDATE, {'title': 'a'}, 'w1')
+        self.queue.enqueue('posts/p1', UPDATE, {'author': 'x'}, 'w1')
+
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.committed, [(UPDATE, 'posts/p1', {'title': 'a', 'author': 'x'})])
+        self.assertEqual(self.queue.pending_for('w1', 'posts'), {})
+
+    def test_update_during_flush_is_queued_separately(self):
+        self.queue.enqueue('posts/p1', SET, {'title': 'a', 'created_at': firestore.SERVER_TIMESTAMP}, 'w1')
+        self.on_commit = lambda batch: self.queue.enqueue('posts/p1', UPDATE, {'title': 'b'}, 'w1')
+
+        self.assertEqual(self.queue.flush(), 1)
+        self.on_commit = None
+        pending = self.queue.pending_for('w1', 'posts')
+        self.assertEqual([(op, data) for op, data, _ in pending['p1']], [(UPDATE, {'title': 'b'})])
+
+        # The follow-up is an update, so the post keeps its original created_at
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.committed[-1], (UPDATE, 'posts/p1', {'title': 'b'}))
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_concurrent_flush_skips_documents_in_flight(self):
+        other_worker = WriteBehindQueue(self.journal)
+        self.queue.enqueue('posts/p1', SET, {'title': 'a'})
+        sent_by_other_worker = []
+
+        def race(batch):
+            self.queue.enqueue('posts/p1', DELETE)
+            self.queue.enqueue('posts/p2', SET, {'title': 'c'})
+            self.on_commit = None
+            sent_by_other_worker.append(other_worker.flush())
+
+        self.on_commit = race
+        self.queue.flush()
+
+        # The other worker only sent p2; the delete of p1 waited for the set
+        self.assertEqual(sent_by_other_worker, [1])
+        self.assertEqual(self.committed, [(SET, 'posts/p2', {'title': 'c'}), (SET, 'posts/p1', {'title': 'a'})])
+        self.assertEqual(other_worker.flush(), 1)
+        self.assertEqual(self.committed[-1], (DELETE, 'posts/p1', None))
+
+    def test_transient_failure_keeps_writes_for_retry(self):
+        self.queue.enqueue('posts/p1', UPDATE, {'title': 'a'})
+
+        def fail(batch):
+            raise google_exceptions.ServiceUnavailable('down')
+
+        self.on_commit = fail
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            self.queue.flush()
+
+        self.on_commit = None
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.committed, [(UPDATE, 'posts/p1', {'title': 'a'})])
+
+    def test_permanent_failure_drops_only_the_bad_write(self):
+        self.queue.enqueue('posts/missing', UPDATE, {'title': 'a'})
+        self.queue.enqueue('posts/p2', SET, {'title': 'b'})
+
+        def reject_missing(batch):
+            if any(path == 'posts/missing' for _, path, _ in batch.ops):
+                raise google_exceptions.NotFound('no document')
+
+        self.on_commit = reject_missing
+        self.queue.flush()
+
+        self.assertEqual(self.committed, [(SET, 'posts/p2', {'title': 'b'})])
+        self.assertEqual(self.queue.flush(), 0)
+
+    def test_stale_update_after_delete_does_not_resurrect_the_document(self):
+        self.queue.enqueue('posts/p1', DELETE, writer='w1')
+        self.queue.enqueue('posts/p1', UPDATE, {'title': 'b'}, 'w1')
+
+        self.assertIsNone(write_behind.apply_pending({'title': 'a'}, self.queue.pending_for('w1', 'posts')['p1']))
+        self.queue.flush()
+        self.assertEqual(self.committed, [(DELETE, 'posts/p1', None)])
+
+    def test_every_writer_sees_a_coalesced_write(self):
+        self.queue.enqueue('posts/p1', UPDATE, {'title': 'a'}, 'w1')
+        self.queue.enqueue('posts/p1', UPDATE, {'author': 'x'}, 'w2')
+
+        for writer in ('w1', 'w2'):
+            pending = self.queue.pending_for(writer, 'posts')
+            self.assertEqual([data for _, data, _ in pending['p1']], [{'title': 'a', 'author': 'x'}])
+        self.assertEqual(self.queue.pending_for('w3', 'posts'), {})
+
+
+class StartTests(SimpleTestCase):
+    def test_start_does_nothing_when_write_behind_is_off(self):
+        with self.settings(FIRESTORE_WRITE_BEHIND=False), mock.patch.object(write_behind, 'get_queue') as get_queue:
+            write_behind.start()
+        get_queue.assert_not_called()
+
+    def test_start_creates_the_queue_when_write_behind_is_on(self):
+        with self.settings(FIRESTORE_WRITE_BEHIND=True), mock.patch.object(write_behind, 'get_queue') as get_queue:
+            write_behind.start()
+        get_queue.assert_called_once_with()
@@ -0,0 +1,450 @@
+"""
+Opt-in write-behind queue for Firestore mutations.
+
+With FIRESTORE_WRITE_BEHIND enabled, views queue their writes instead of
+blocking on one RPC each. Pending writes are kept in a local SQLite journal
+(so they survive a worker restart), rapid updates to the same document are
+coalesced into one write, and a background thread flushes them in WriteBatches
+of up to 500 operations whenever the batch fills up or the flush interval passes.
+
+The user who submitted a write keeps seeing it before it is flushed: their
+browser gets a signed writer cookie and views lay the pending writes to any
+document that writer touched over what they read from Firestore (see
+`pending_for` and `apply_pending`).
+
+With the setting off, the queue_* helpers write to Firestore synchronously.
+"""
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+
+from djangofirebase.settings import db
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects WriteBatches with more than 500 operations
+MAX_BATCH_SIZE = 500
+WRITER_COOKIE = 'wb_writer'
+WRITER_COOKIE_SALT = 'djangofirebase.write-behind'
+WRITER_COOKIE_MAX_AGE = 60 * 60 * 24
+
+SET = 'set'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# Errors that will never succeed on retry, e.g. updating a document that was deleted
+_PERMANENT_ERRORS = (google_exceptions.NotFound, google_exceptions.InvalidArgument)
+
+_SENTINELS = {
+    'server_timestamp': firestore.SERVER_TIMESTAMP,
+    'delete_field': firestore.DELETE_FIELD,
+}
+
+
+def is_enabled():
+    return getattr(settings, 'FIRESTORE_WRITE_BEHIND', False)
+
+
+def _encode_value(value):
+    for name, sentinel in _SENTINELS.items():
+        if value is sentinel:
+            return {'$sentinel': name}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    raise TypeError(f"Cannot queue value of type {type(value).__name__}")
+
+
+def _decode_value(obj):
+    if '$sentinel' in obj:
+        return _SENTINELS[obj['$sentinel']]
+    if '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    return obj
+
+
+def _dumps(data):
+    return json.dumps(data, default=_encode_value)
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode_value)
+
+
+def _coalesce(previous_op, previous_data, op, data):
+    """
+    Folds a new write into the one already pending for the same document.
+    Only writes that no flush has claimed yet are folded into.
+    """
+    if op == UPDATE and previous_op == UPDATE:
+        return UPDATE, {**previous_data, **data}
+    if op == UPDATE and previous_op == SET:
+        merged = {**previous_data, **data}
+        # A set writes the whole document, so a field deletion just means leaving it out
+        return SET, {key: value for key, value in merged.items() if value is not firestore.DELETE_FIELD}
+    if op == UPDATE and previous_op == DELETE:
+        # Updating a deleted document fails in Firestore, so the delete stands
+        return DELETE, {}
+    return op, data
+
+
+class WriteBehindQueue:
+    """
+    Pending writes journaled in SQLite, shared by every worker process.
+
+    A document can have several journal entries: at most one that is still
+    open for coalescing, plus any that a flush has claimed and is sending.
+    A flush claims entries inside a write transaction and only ever claims the
+    oldest entry of a document, so two workers never send writes to the same
+    document at once and writes to a document land in the order they were made.
+    Claims older than `claim_timeout` seconds are treated as abandoned by a
+    worker that died mid-flush and are picked up again.
+    """
+
+    def __init__(self, path, batch_size=MAX_BATCH_SIZE, flush_interval=2.0, claim_timeout=300):
+        self.path = str(path)
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.claim_timeout = claim_timeout
+        self._wake = threading.Event()
+        self._thread = None
+        self._init_journal()
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def _init_journal(self):
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS writes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " path TEXT NOT NULL,"
+                " op TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " queued_at TEXT NOT NULL,"
+                " claimed_by TEXT,"
+                " claimed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS writes_path ON writes (path, id)")
+            # Everyone who contributed to a (possibly coalesced) write, for the read-your-writes overlay
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS write_writers ("
+                " write_id INTEGER NOT NULL,"
+                " writer TEXT NOT NULL,"
+                " PRIMARY KEY (write_id, writer))"
+            )
+
+    def start(self):
+        """
+        Starts the background flusher; anything left in the journal by a
+        previous worker is flushed on its first pass.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='firestore-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush_all)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush_all()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {str(e)}")
+
+    def enqueue(self, doc_path, op, data=None, writer=None):
+        data = data or {}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, op, data FROM writes WHERE path = ? AND claimed_by IS NULL"
+                    " ORDER BY id DESC LIMIT 1",
+                    (doc_path,),
+                ).fetchone()
+                if row is not None:
+                    write_id = row[0]
+                    op, data = _coalesce(row[1], _loads(row[2]), op, data)
+                    conn.execute(
+                        "UPDATE writes SET op = ?, data = ? WHERE id = ?", (op, _dumps(data), write_id)
+                    )
+                else:
+                    write_id = conn.execute(
+                        "INSERT INTO writes (path, op, data, queued_at) VALUES (?, ?, ?, ?)",
+                        (doc_path, op, _dumps(data), timezone.now().isoformat()),
+                    ).lastrowid
+                if writer is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO write_writers (write_id, writer) VALUES (?, ?)",
+                        (write_id, writer),
+                    )
+                pending_count = conn.execute(
+                    "SELECT COUNT(*) FROM writes WHERE claimed_by IS NULL"
+                ).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if pending_count >= self.batch_size:
+            self._wake.set()
+
+    def pending_for(self, writer, collection):
+        """
+        Returns {doc_id: [(op, data, queued_at), ...]} with every pending write,
+        oldest first, to the documents in a collection that a writer has pending writes to.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path, op, data, queued_at FROM writes WHERE path IN ("
+                " SELECT w.path FROM writes w JOIN write_writers ww ON ww.write_id = w.id"
+                " WHERE ww.writer = ? AND substr(w.path, 1, ?) = ?"
+                ") ORDER BY id",
+                (writer, len(collection) + 1, f"{collection}/"),
+            ).fetchall()
+        pending = {}
+        for path, op, data, queued_at in rows:
+            doc_id = path[len(collection) + 1:]
+            # Skip documents in subcollections
+            if '/' not in doc_id:
+                pending.setdefault(doc_id, []).append((op, _loads(data), datetime.fromisoformat(queued_at)))
+        return pending
+
+    def _claim(self, claim):
+        """
+        Claims up to one batch of writes, at most one per document, for this flush.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, path, op, data FROM writes w"
+                    " WHERE (claimed_by IS NULL OR claimed_at < ?)"
+                    " AND NOT EXISTS (SELECT 1 FROM writes e WHERE e.path = w.path AND e.id < w.id)"
+                    " ORDER BY id LIMIT ?",
+                    (now - self.claim_timeout, self.batch_size),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE writes SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                    [(claim, now, row[0]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _finish(self, claim, rows, done):
+        """
+        Removes the writes that were sent and releases the claim on the rest.
+        """
+        done_ids = {row[0] for row in done}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for write_id, _, _, _ in rows:
+                    if write_id in done_ids:
+                        conn.execute(
+                            "DELETE FROM writes WHERE id = ? AND claimed_by = ?", (write_id, claim)
+                        )
+                        conn.execute("DELETE FROM write_writers WHERE write_id = ?", (write_id,))
+                    else:
+                        conn.execute(
+                            "UPDATE writes SET claimed_by = NULL, claimed_at = NULL"
+                            " WHERE id = ? AND claimed_by = ?",
+                            (write_id, claim),
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def flush_all(self):
+        while self.flush() == self.batch_size:
+            pass
+
+    def flush(self):
+        """
+        Commits up to one batch of pending writes and returns how many were written
+        (fewer than the batch size when the journal is drained or some writes must be retried).
+        """
+        claim = uuid.uuid4().hex
+        rows = self._claim(claim)
+        if not rows:
+            return 0
+
+        done = []
+        try:
+            batch = db.batch()
+            for _, path, op, data in rows:
+                _add_to_batch(batch, path, op, _loads(data))
+            try:
+                batch.commit()
+                done = rows
+            except _PERMANENT_ERRORS:
+                # One bad write fails the whole batch, so retry them one by one
+                done = self._commit_individually(rows)
+        finally:
+            self._finish(claim, rows, done)
+        return len(done)
+
+    def _commit_individually(self, rows):
+        done = []
+        for row in rows:
+            _, path, op, data = row
+            batch = db.batch()
+            _add_to_batch(batch, path, op, _loads(data))
+            try:
+                batch.commit()
+            except _PERMANENT_ERRORS as e:
+                logger.error(f"Dropping queued {op} on {path}: {str(e)}")
+            except Exception as e:
+                # Transient failure: leave it in the journal for the next flush
+                logger.warning(f"Queued {op} on {path} failed, will retry: {str(e)}")
+                continue
+            done.append(row)
+        return done
+
+
+def _add_to_batch(batch, path, op, data):
+    doc_ref = db.document(path)
+    if op == SET:
+        batch.set(doc_ref, data)
+    elif op == UPDATE:
+        batch.update(doc_ref, data)
+    else:
+        batch.delete(doc_ref)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Returns this process's queue, starting its flusher on first use.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteBehindQueue(
+                settings.FIRESTORE_WRITE_BEHIND_JOURNAL,
+                batch_size=settings.FIRESTORE_WRITE_BEHIND_BATCH_SIZE,
+                flush_interval=settings.FIRESTORE_WRITE_BEHIND_INTERVAL,
+            )
+            _queue.start()
+    return _queue
+
+
+def start():
+    """
+    Starts this process's flusher when write-behind is on, so writes a previous
+    worker left in the journal go out without waiting for the next mutation.
+    Called from the WSGI/ASGI entry points, which only server processes load;
+    management commands never flush unless they queue writes themselves.
+    """
+    if is_enabled():
+        get_queue()
+
+
+def writer_id(request):
+    """
+    Returns the write-behind identity of the browser making the request,
+    issuing a new one if it has none yet.
+    """
+    return request.get_signed_cookie(
+        WRITER_COOKIE, default=None, salt=WRITER_COOKIE_SALT, max_age=WRITER_COOKIE_MAX_AGE
+    ) or uuid.uuid4().hex
+
+
+def remember_writer(response, writer):
+    """
+    Sets the writer cookie so the next requests see this writer's pending writes.
+    """
+    if is_enabled():
+        response.set_signed_cookie(
+            WRITER_COOKIE, writer, salt=WRITER_COOKIE_SALT, max_age=WRITER_COOKIE_MAX_AGE, httponly=True
+        )
+    return response
+
+
+def queue_set(doc_ref, data, writer=None):
+    if is_enabled():
+        get_queue().enqueue(doc_ref.path, SET, data, writer)
+    else:
+        doc_ref.set(data)
+
+
+def queue_update(doc_ref, data, writer=None):
+    if is_enabled():
+        get_queue().enqueue(doc_ref.path, UPDATE, data, writer)
+    else:
+        doc_ref.update(data)
+
+
+def queue_delete(doc_ref, writer=None):
+    if is_enabled():
+        get_queue().enqueue(doc_ref.path, DELETE, writer=writer)
+    else:
+        doc_ref.delete()
+
+
+def pending_for(request, collection):
+    """
+    Returns the requesting browser's pending writes in a collection, or {}
+    when write-behind is off or the browser has not written anything.
+    """
+    if not is_enabled():
+        return {}
+    writer = request.get_signed_cookie(
+        WRITER_COOKIE, default=None, salt=WRITER_COOKIE_SALT, max_age=WRITER_COOKIE_MAX_AGE
+    )
+    if writer is None:
+        return {}
+    return get_queue().pending_for(writer, collection)
+
+
+def apply_pending(data, pending):
+    """
+    Lays a document's pending writes, oldest first, over what was read from
+    Firestore (`data` may be None if it does not exist yet).
+    Returns None if the document will not exist once the writes are flushed.
+    Server timestamps show the time the write was queued.
+    """
+    for op, pending_data, queued_at in pending:
+        if op == DELETE:
+            data = None
+            continue
+        if op == UPDATE and data is None:
+            # Firestore rejects updates to missing documents, so this one will be dropped
+            continue
+        data = {} if op == SET else dict(data)
+        for key, value in pending_data.items():
+            if value is firestore.DELETE_FIELD:
+                data.pop(key, None)
+            elif value is firestore.SERVER_TIMESTAMP:
+                data[key] = queued_at
+            else:
+                data[key] = value
+    return data
+
+
+def creates_document(pending):
+    """
+    True if a document's pending writes include a set, i.e. its current
+    contents come from the journal rather than from Firestore.
+    """
+    return any(op == SET for op, _, _ in pending)
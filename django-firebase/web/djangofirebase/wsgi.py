@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangofirebase.settings')
 
 application = get_wsgi_application()
+
+from djangofirebase import write_behind  # noqa: E402  (needs the app registry loaded above)
+
+write_behind.start()
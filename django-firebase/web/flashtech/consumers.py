@@ -6,6 +6,11 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 
 class ClientScreenConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        # Only pages rendered with a valid screen token may connect
+        if self.scope.get('screen') is None:
+            await self.close()
+            return
+
         self.group_name = 'client_screen_group'
         await self.channel_layer.group_add(
             self.group_name,
@@ -14,6 +19,8 @@ class ClientScreenConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        if self.scope.get('screen') is None:
+            return
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
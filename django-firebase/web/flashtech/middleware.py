@@ -0,0 +1,18 @@
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+
+from .tokens import verify_screen_token
+
+
+class ScreenTokenAuthMiddleware(BaseMiddleware):
+    """
+    Verifies the ?token= query parameter of a WebSocket handshake and puts the
+    payload in scope['screen'] (None when the token is invalid).
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        query = parse_qs(scope.get('query_string', b'').decode())
+        scope['screen'] = verify_screen_token(query.get('token', [None])[0])
+        return await super().__call__(scope, receive, send)
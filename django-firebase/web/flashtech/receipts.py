@@ -0,0 +1,179 @@
+"""
+Receipt rendering and storage.
+
+A receipt is rendered once, when a payment is recorded, and stored in Firestore
+as HTML plus a plain-text variant sized for thermal receipt printers.
+Reprints are served from that store (fronted by Django's cache) instead of
+re-reading the order and re-rendering the template.
+"""
+import re
+import uuid
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from djangofirebase.settings import db
+from firebase_admin.firestore import firestore
+from google.api_core import exceptions as google_exceptions
+
+from .templatetags.custom_filters import add_commas
+
+RECEIPTS_COLLECTION = 'flashtech-receipt'
+# Field on the order document pointing at its latest receipt
+LAST_RECEIPT_FIELD = 'lastReceiptPaymentId'
+RECEIPT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# 80mm thermal printers fit 42 characters per line in the default font
+RECEIPT_TEXT_WIDTH = 42
+
+# ESC @ resets the printer, GS V 66 0 feeds the paper and does a partial cut
+ESCPOS_INIT = b'\x1b@'
+ESCPOS_CUT = b'\x1dVB\x00'
+
+
+def new_payment_id():
+    return uuid.uuid4().hex[:12]
+
+
+def is_valid_payment_id(payment_id):
+    return bool(re.fullmatch(r'[A-Za-z0-9_-]{1,64}', payment_id or ''))
+
+
+def receipt_id(order_id, payment_id):
+    return f"{order_id}_{payment_id}"
+
+
+def _cache_key(order_id, payment_id):
+    return f"receipt:{receipt_id(order_id, payment_id)}"
+
+
+def build_receipt_context(order_id, order_data, amount_paid, change):
+    """
+    Collects everything the receipt templates need from an order document
+    that has already been read.
+    """
+    return {
+        'order_id': order_id,
+        'order_type': order_data.get('type'),
+        'order_owner': order_data.get('orderOwner', {}),
+        'order_mechanic': order_data.get('orderMechanic', {}),
+        'mileage': order_data.get('mileage'),
+        'vehicle_name': order_data.get('name'),
+        'vehicle_number_plate': order_data.get('numberPlate'),
+        'amount_to_pay': int(order_data.get('value', 0)),
+        'amount_paid': amount_paid,
+        'change': change,
+    }
+
+
+def _text_row(label, value, width=RECEIPT_TEXT_WIDTH):
+    value = '' if value is None else str(value)
+    gap = max(1, width - len(label) - len(value))
+    return f"{label}{' ' * gap}{value}"
+
+
+def render_receipt_text(context, width=RECEIPT_TEXT_WIDTH):
+    """
+    Renders the fixed-width plain-text receipt used for thermal printers.
+    """
+    owner = context['order_owner']
+    mechanic = context['order_mechanic']
+    rule = '-' * width
+    lines = [
+        'Flashtech Workshop'.center(width),
+        '123 Main Street'.center(width),
+        'Nairobi, KE 00100'.center(width),
+        'Tel: +254 712 345 678'.center(width),
+        rule,
+        _text_row('Order ID:', context['order_id'], width),
+        _text_row('Order Type:', context['order_type'], width),
+        rule,
+        'Order Owner',
+        _text_row('Name:', owner.get('name'), width),
+        _text_row('Email:', owner.get('email'), width),
+        _text_row('Phone:', owner.get('phone'), width),
+        rule,
+        'Order Mechanic',
+        _text_row('Name:', mechanic.get('name'), width),
+        rule,
+        'Vehicle',
+        _text_row('Mileage:', context['mileage'], width),
+        _text_row('Name:', context['vehicle_name'], width),
+        _text_row('Number Plate:', context['vehicle_number_plate'], width),
+        rule,
+        _text_row('Sub Total', f"Shs.{add_commas(context['amount_to_pay'])}", width),
+        _text_row('Paid', f"Shs.{add_commas(context['amount_paid'])}", width),
+        _text_row('Change', f"Shs.{add_commas(context['change'])}", width),
+        rule,
+        'THANK YOU!'.center(width),
+        'Glad to see you again!'.center(width),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def to_escpos(text):
+    """
+    Wraps a plain-text receipt in the ESC/POS commands to initialise the
+    printer and cut the paper once it is printed.
+    """
+    return ESCPOS_INIT + text.encode('ascii', 'replace') + b'\n\n\n' + ESCPOS_CUT
+
+
+def create_receipt(order_id, payment_id, context):
+    """
+    Renders both receipt variants, stores them keyed by order and payment and
+    records the payment on the order so later visits can reprint it.
+    The payment ID doubles as an idempotency key: if a receipt already exists
+    for it (a double-click or a retried request), that receipt is returned
+    instead of storing a duplicate.
+    Returns the stored receipt dict.
+    """
+    receipt = {
+        'order_id': order_id,
+        'payment_id': payment_id,
+        'amount_paid': context['amount_paid'],
+        'change': context['change'],
+        'html': render_to_string('flashtech/print_receit.html', context),
+        'text': render_receipt_text(context),
+        'created_at': timezone.now(),
+    }
+    batch = db.batch()
+    batch.create(db.collection(RECEIPTS_COLLECTION).document(receipt_id(order_id, payment_id)), receipt)
+    batch.update(db.collection('flashtech-order').document(order_id), {LAST_RECEIPT_FIELD: payment_id})
+    try:
+        batch.commit()
+    except google_exceptions.AlreadyExists:
+        return get_receipt(order_id, payment_id)
+    cache.set(_cache_key(order_id, payment_id), receipt, RECEIPT_CACHE_TIMEOUT)
+    return receipt
+
+
+def get_receipt(order_id, payment_id):
+    """
+    Returns a stored receipt, or None if no receipt exists for this payment.
+    """
+    key = _cache_key(order_id, payment_id)
+    receipt = cache.get(key)
+    if receipt is not None:
+        return receipt
+
+    receipt_doc = db.collection(RECEIPTS_COLLECTION).document(receipt_id(order_id, payment_id)).get()
+    if not receipt_doc.exists:
+        return None
+    receipt = receipt_doc.to_dict()
+    cache.set(key, receipt, RECEIPT_CACHE_TIMEOUT)
+    return receipt
+
+
+def stream_receipts(start, end):
+    """
+    Yields the receipts created in [start, end), oldest first.
+    """
+    query = (
+        db.collection(RECEIPTS_COLLECTION)
+        .where('created_at', '>=', start)
+        .where('created_at', '<', end)
+        .order_by('created_at', direction=firestore.Query.ASCENDING)
+    )
+    for doc in query.stream():
+        yield doc.to_dict()
@@ -20,6 +20,19 @@ def to_range(value):
     return range(value)
 
 
+def _group_names(user):
+    """
+    Loads the user's group names once and keeps them on the user object,
+    which lives for the rest of the request.
+    """
+    if not hasattr(user, '_group_names_cache'):
+        if user.is_authenticated:
+            user._group_names_cache = frozenset(user.groups.values_list('name', flat=True))
+        else:
+            user._group_names_cache = frozenset()
+    return user._group_names_cache
+
+
 @register.filter(name='has_group')
 def has_group(user, group_name):
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+    return group_name in _group_names(user)
\ No newline at end of file
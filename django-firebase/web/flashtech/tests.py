@@ -1,3 +1,223 @@
-from django.test import TestCase
+import json
+import time
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from google.api_core import exceptions as google_exceptions
+
+from flashtech import receipts, tokens, views
+from flashtech.middleware import ScreenTokenAuthMiddleware
+from flashtech.routing import websocket_urlpatterns
+
+
+class FakeDoc:
+    def __init__(self, data, exists=True):
+        self._data = data
+        self.exists = exists
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+ORDER = {
+    'type': 'Express',
+    'value': 1000,
+    'orderOwner': {'name': 'Ann', 'email': 'ann@example.com', 'phone': '0700'},
+    'orderMechanic': {'name': 'Bob'},
+    'mileage': 1200,
+    'name': 'Corolla',
+    'numberPlate': 'KAA 123A',
+}
+
+
+class ReceiptTextTests(SimpleTestCase):
+    def setUp(self):
+        context = receipts.build_receipt_context('o1', ORDER, 1500.0, 500.0)
+        self.lines = receipts.render_receipt_text(context).splitlines()
+
+    def test_lines_fit_the_printer_width(self):
+        for line in self.lines:
+            self.assertLessEqual(len(line), receipts.RECEIPT_TEXT_WIDTH, line)
+
+    def test_money_is_right_aligned_with_commas(self):
+        width = receipts.RECEIPT_TEXT_WIDTH
+        self.assertIn('Sub Total'.ljust(width - len('Shs.1,000')) + 'Shs.1,000', self.lines)
+        self.assertIn('Paid'.ljust(width - len('Shs.1,500')) + 'Shs.1,500', self.lines)
+        self.assertIn('Change'.ljust(width - len('Shs.500')) + 'Shs.500', self.lines)
+
+    def test_missing_values_leave_the_column_blank(self):
+        context = receipts.build_receipt_context('o1', {'value': 10}, 10, 0)
+        lines = receipts.render_receipt_text(context).splitlines()
+        self.assertIn('Mileage:'.ljust(receipts.RECEIPT_TEXT_WIDTH), lines)
+
+
+class EscposTests(SimpleTestCase):
+    def test_text_is_framed_by_init_and_cut(self):
+        data = receipts.to_escpos('Shs.1,000\n')
+        self.assertTrue(data.startswith(receipts.ESCPOS_INIT + b'Shs.1,000\n'))
+        self.assertTrue(data.endswith(b'\n\n\n' + receipts.ESCPOS_CUT))
+
+    def test_non_ascii_is_replaced(self):
+        self.assertIn(b'Caf?', receipts.to_escpos('Café'))
+
+
+class CreateReceiptTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(receipts, 'db')
+        self.db = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.context = receipts.build_receipt_context('o1', ORDER, 1500.0, 500.0)
+
+    def test_stores_receipt_and_records_it_on_the_order(self):
+        receipt = receipts.create_receipt('o1', 'k1', self.context)
+
+        batch = self.db.batch.return_value
+        self.assertEqual(batch.create.call_args[0][1], receipt)
+        batch.update.assert_called_once_with(mock.ANY, {receipts.LAST_RECEIPT_FIELD: 'k1'})
+        self.assertEqual(receipt['amount_paid'], 1500.0)
+        self.assertIn('Shs.1,500', receipt['text'])
+        self.assertEqual(receipts.get_receipt('o1', 'k1'), receipt)
+
+    def test_existing_receipt_is_returned_instead_of_a_duplicate(self):
+        stored = {'order_id': 'o1', 'payment_id': 'k1', 'amount_paid': 1200.0, 'change': 200.0}
+        self.db.batch.return_value.commit.side_effect = google_exceptions.AlreadyExists('exists')
+        self.db.collection.return_value.document.return_value.get.return_value = FakeDoc(stored)
+
+        self.assertEqual(receipts.create_receipt('o1', 'k1', self.context), stored)
+
+
+class RecordAmountPaidTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        views_db = self.patch(views, 'db')
+        views_db.collection.return_value.document.return_value.get.return_value = FakeDoc(ORDER)
+        self.receipts_db = self.patch(receipts, 'db')
+        self.patch(views, 'get_channel_layer')
+        self.patch(views, 'async_to_sync')
+
+    def patch(self, target, name):
+        patcher = mock.patch.object(target, name)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def pay(self, amount, payment_key):
+        request = RequestFactory().post('/', {'amount_paid': amount, 'payment_key': payment_key})
+        return views.record_amount_paid(request, 'o1')
+
+    def test_success_returns_the_receipt_and_a_fresh_key(self):
+        response = self.pay('1500', 'k1')
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['payment_id'], 'k1')
+        self.assertEqual(data['receipt_url'], '/receipt/o1/k1/')
+        self.assertTrue(receipts.is_valid_payment_id(data['next_payment_key']))
+        self.assertNotEqual(data['next_payment_key'], 'k1')
+
+    def test_retry_with_the_same_amount_reuses_the_receipt(self):
+        self.pay('1500', 'k1')
+        self.receipts_db.batch.return_value.commit.side_effect = google_exceptions.AlreadyExists('exists')
+
+        response = self.pay('1500', 'k1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['change'], 500.0)
+
+    def test_same_key_with_a_different_amount_is_rejected(self):
+        self.pay('1500', 'k1')
+        self.receipts_db.batch.return_value.commit.side_effect = google_exceptions.AlreadyExists('exists')
+
+        response = self.pay('2000', 'k1')
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_invalid_key_is_rejected(self):
+        self.assertEqual(self.pay('1500', 'not a key!').status_code, 400)
+
+
+class ReceiptExportTests(SimpleTestCase):
+    def test_bad_dates_return_400(self):
+        # 'garbage' does not parse at all; '2026-13-45' parses but is not a real date
+        for date in ('garbage', '2026-13-45'):
+            response = views.receipt_export(RequestFactory().get('/', {'date': date}))
+            self.assertEqual(response.status_code, 400, date)
+
+    def test_exports_the_days_receipts_as_text(self):
+        stored = [{'text': 'first\n'}, {'text': 'second\n'}]
+        with mock.patch.object(receipts, 'stream_receipts', return_value=iter(stored)):
+            response = views.receipt_export(RequestFactory().get('/', {'date': '2026-10-19'}))
+
+        self.assertEqual(b''.join(response.streaming_content), b'first\n\nsecond\n\n')
+        self.assertIn('receipts-2026-10-19.txt', response['Content-Disposition'])
+
+
+class ScreenTokenTests(SimpleTestCase):
+    def test_fresh_token_verifies(self):
+        token = tokens.make_screen_token('cashier')
+        self.assertEqual(tokens.verify_screen_token(token), {'terminal': 'cashier'})
+
+    def test_missing_token_is_rejected(self):
+        self.assertIsNone(tokens.verify_screen_token(None))
+        self.assertIsNone(tokens.verify_screen_token(''))
+
+    def test_tampered_token_is_rejected(self):
+        token = tokens.make_screen_token('cashier')
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertIsNone(tokens.verify_screen_token(tampered))
+
+    def test_expired_token_is_rejected(self):
+        issued_at = time.time() - tokens.SCREEN_TOKEN_MAX_AGE - 1
+        with mock.patch('django.core.signing.time.time', return_value=issued_at):
+            token = tokens.make_screen_token('cashier')
+        self.assertIsNone(tokens.verify_screen_token(token))
+
+
+class ScreenTokenAuthMiddlewareTests(SimpleTestCase):
+    async def scope_for(self, query_string):
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen.update(scope)
+
+        await ScreenTokenAuthMiddleware(app)({'type': 'websocket', 'query_string': query_string}, None, None)
+        return seen
+
+    async def test_valid_token_fills_scope(self):
+        token = tokens.make_screen_token('client-screen')
+        scope = await self.scope_for(urlencode({'token': token}).encode())
+        self.assertEqual(scope['screen'], {'terminal': 'client-screen'})
+
+    async def test_missing_or_bad_token_leaves_scope_empty(self):
+        for query_string in (b'', b'token=nope', b'other=1'):
+            scope = await self.scope_for(query_string)
+            self.assertIsNone(scope['screen'], query_string)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ClientScreenConsumerTests(SimpleTestCase):
+    application = ScreenTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def test_handshake_without_token_is_rejected(self):
+        communicator = WebsocketCommunicator(self.application, 'ws/client-screen/')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_handshake_with_bad_token_is_rejected(self):
+        communicator = WebsocketCommunicator(self.application, 'ws/client-screen/?token=nope')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_handshake_with_token_is_accepted(self):
+        token = tokens.make_screen_token('client-screen')
+        communicator = WebsocketCommunicator(self.application, f"ws/client-screen/?{urlencode({'token': token})}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({'action': 'ping'})
+        self.assertEqual(await communicator.receive_json_from(), {'action': 'pong'})
+        await communicator.disconnect()
@@ -0,0 +1,31 @@
+"""
+Signed, short-lived tokens for the WebSocket screens.
+
+A token is issued when the cashier terminal or client screen page is rendered
+and checked at the WebSocket handshake using only SECRET_KEY, so connects and
+reconnects never touch the session or user tables.
+"""
+from django.core import signing
+
+SCREEN_TOKEN_SALT = 'flashtech.screen-token'
+# Pages connect as soon as they load, so the token only has to survive that long
+SCREEN_TOKEN_MAX_AGE = 60 * 5
+
+
+def make_screen_token(terminal):
+    """
+    Issues a token for a terminal, e.g. 'cashier' or 'client-screen'.
+    """
+    return signing.dumps({'terminal': terminal}, salt=SCREEN_TOKEN_SALT, compress=True)
+
+
+def verify_screen_token(token):
+    """
+    Returns the token payload, or None if the token is missing, tampered with or expired.
+    """
+    if not token:
+        return None
+    try:
+        return signing.loads(token, salt=SCREEN_TOKEN_SALT, max_age=SCREEN_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
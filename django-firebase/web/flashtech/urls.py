@@ -5,6 +5,8 @@ urlpatterns = [
     path('', views.order_list, name='order_list'),
     path('client-screen/', views.client_screen, name='client_screen'),
     path('reset-client-screen/', views.reset_client_screen, name='reset_client_screen'),
+    path('receipts/export/', views.receipt_export, name='receipt_export'),
+    path('receipt/<str:order_id>/<str:payment_id>/', views.receipt_detail, name='receipt_detail'),
     path('<str:order_id>/', views.order_detail, name='order_detail'),
     path('amount/<str:order_id>/', views.record_amount_paid, name='record_amount_paid'),
 
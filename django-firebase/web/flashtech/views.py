@@ -1,8 +1,12 @@
 import json
+from datetime import datetime, time, timedelta
 
 from django.core.paginator import Paginator
 from django.shortcuts import render
-from django.http import HttpResponseNotFound, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from djangofirebase.settings import db
 from firebase_admin.firestore import firestore
 
@@ -11,6 +15,9 @@ from channels.layers import get_channel_layer
 
 from django.views.decorators.csrf import csrf_exempt
 
+from . import receipts
+from .tokens import make_screen_token
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -88,6 +95,12 @@ def order_detail(request, order_id):
     balance_remaining = 0
     change = 0
 
+    # Reprints of the last recorded payment come straight from the receipt store
+    receipt_url = None
+    last_payment_id = order_data.get(receipts.LAST_RECEIPT_FIELD)
+    if last_payment_id:
+        receipt_url = reverse('receipt_detail', args=[order_id, last_payment_id])
+
     # New order details dictionary to send
     order_details_for_client = {
         'id': order_id,
@@ -119,6 +132,9 @@ def order_detail(request, order_id):
         'vehicle_number_plate': vehicle_number_plate,
         'amount_paid': amount_paid,
         'change': change,
+        'screen_token': make_screen_token('cashier'),
+        'receipt_url': receipt_url,
+        'payment_key': receipts.new_payment_id(),
     }
 
     return render(request, 'flashtech/order_detail.html', context)
@@ -167,6 +183,28 @@ def record_amount_paid(request, order_id):
 
         change = amount_paid - amount_to_pay
 
+        # The page sends a payment key so a double-click or retry reuses the
+        # first receipt instead of recording the payment twice
+        payment_id = request.POST.get('payment_key', '').strip() or receipts.new_payment_id()
+        if not receipts.is_valid_payment_id(payment_id):
+            return JsonResponse({
+                'status': 'ko',
+                'error': 'Invalid payment key. Reload the page and try again.'
+            }, status=400)
+
+        # Render the receipt once now so reprints never hit the order again
+        receipt = receipts.create_receipt(
+            order_id,
+            payment_id,
+            receipts.build_receipt_context(order_id, order_data, amount_paid, change),
+        )
+        if receipt['amount_paid'] != amount_paid:
+            # Same key but a different amount: not a retry, so don't pass off the old receipt
+            return JsonResponse({
+                'status': 'ko',
+                'error': 'This payment was already recorded with a different amount. Reload the page to record a new payment.'
+            }, status=409)
+
         # This is the key part that sends the WebSocket message.
         # It's correctly placed after a successful payment validation.
         channel_layer = get_channel_layer()
@@ -184,6 +222,9 @@ def record_amount_paid(request, order_id):
             'amount_paid': amount_paid,
             'change': change,
             'value': amount_to_pay,
+            'payment_id': payment_id,
+            'receipt_url': reverse('receipt_detail', args=[order_id, payment_id]),
+            'next_payment_key': receipts.new_payment_id(),
         })
 
     except (ValueError, TypeError) as e:
@@ -206,7 +247,9 @@ def client_screen(request):
     Renders the default page for the client screen display.
     This page will connect to a WebSocket to receive updates.
     """
-    return render(request, 'flashtech/client_screen.html')
+    return render(request, 'flashtech/client_screen.html', {
+        'screen_token': make_screen_token('client-screen'),
+    })
 
 
 @csrf_exempt
@@ -222,3 +265,49 @@ def reset_client_screen(request):
         }
     )
     return JsonResponse({'status': 'ok'})
+
+
+def receipt_detail(request, order_id, payment_id):
+    """
+    Serves a stored receipt for reprinting.
+    Use ?format=text for the plain-text variant or ?format=escpos for raw printer bytes.
+    """
+    receipt = receipts.get_receipt(order_id, payment_id)
+    if receipt is None:
+        return HttpResponseNotFound("Receipt not found.")
+
+    receipt_format = request.GET.get('format', 'html')
+    if receipt_format == 'text':
+        return HttpResponse(receipt['text'], content_type='text/plain; charset=utf-8')
+    if receipt_format == 'escpos':
+        return HttpResponse(receipts.to_escpos(receipt['text']), content_type='application/octet-stream')
+    return HttpResponse(receipt['html'])
+
+
+def receipt_export(request):
+    """
+    Exports every receipt stored on a given day (?date=YYYY-MM-DD, default today)
+    as one plain-text file, or as a single ESC/POS print job with ?format=escpos.
+    """
+    date_str = request.GET.get('date', '').strip()
+    try:
+        day = parse_date(date_str) if date_str else timezone.localdate()
+    except ValueError:
+        day = None
+    if day is None:
+        return HttpResponseBadRequest("Invalid date. Use YYYY-MM-DD.")
+
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = start + timedelta(days=1)
+    docs = receipts.stream_receipts(start, end)
+
+    if request.GET.get('format') == 'escpos':
+        chunks = (receipts.to_escpos(receipt['text']) for receipt in docs)
+        response = StreamingHttpResponse(chunks, content_type='application/octet-stream')
+        extension = 'bin'
+    else:
+        chunks = (receipt['text'] + '\n' for receipt in docs)
+        response = StreamingHttpResponse(chunks, content_type='text/plain; charset=utf-8')
+        extension = 'txt'
+    response['Content-Disposition'] = f'attachment; filename="receipts-{day.isoformat()}.{extension}"'
+    return response